@@ -1,13 +1,18 @@
-import os, re, pickle, math, time
-from collections import Counter
+import os, re, time, asyncio, itertools, secrets, hashlib
+from collections import OrderedDict
 from datetime import datetime
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+import numpy as np
+import orjson
+from numba import njit
+import joblib
+from sklearn.feature_extraction.text import HashingVectorizer
+from quart import Quart, request
+from quart_cors import cors
 from google import genai
 
-# ================= FLASK =================
-app = Flask(__name__)
-CORS(app)
+# ================= QUART =================
+app = Quart(__name__)
+app = cors(app)
 app.config["MAX_CONTENT_LENGTH"] = 10 * 1024 * 1024
 
 # ================= GEMINI =================
@@ -30,8 +35,70 @@ def gemini_allowed():
 
 # ================= ML =================
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-model = pickle.load(open(os.path.join(BASE_DIR, "model.pkl"), "rb"))
-vectorizer = pickle.load(open(os.path.join(BASE_DIR, "vectorizer.pkl"), "rb"))
+# mmap the fitted arrays instead of copying them
+model = joblib.load(os.path.join(BASE_DIR, "model.joblib"), mmap_mode="r")
+# stateless, must match the vectorizer in train_model.py
+vectorizer = HashingVectorizer(n_features=1 << 16, alternate_sign=False, norm="l2")
+
+# concurrent /analyze requests are batched into one transform + predict
+CLASSIFY_CACHE = OrderedDict()
+CLASSIFY_CACHE_SIZE = 8192
+BATCH_SIZE = 32
+BATCH_WAIT = 0.01
+BATCH_QUEUE = None
+BATCH_TASK = None
+CLASSIFY_TIMEOUT = 5
+SHORT_MESSAGE = 20
+
+async def classify(msg: str) -> str:
+    if not msg.strip():
+        return "Safe"
+    # key on a fixed-size digest so cached entries don't pin large messages
+    key = hashlib.blake2b(msg.encode(), digest_size=16).digest()
+    ml = CLASSIFY_CACHE.get(key)
+    if ml is not None:
+        CLASSIFY_CACHE.move_to_end(key)
+        return ml
+
+    ensure_batch_classifier()
+    fut = asyncio.get_running_loop().create_future()
+    await BATCH_QUEUE.put((msg, key, fut))
+    return await asyncio.wait_for(fut, CLASSIFY_TIMEOUT)
+
+# the queue binds to the loop that first uses it, so it is made alongside the task
+def ensure_batch_classifier():
+    global BATCH_QUEUE, BATCH_TASK
+    if (BATCH_TASK is None or BATCH_TASK.done()
+            or BATCH_TASK.get_loop() is not asyncio.get_running_loop()):
+        BATCH_QUEUE = asyncio.Queue()
+        BATCH_TASK = asyncio.create_task(batch_classifier(BATCH_QUEUE))
+
+async def batch_classifier(queue):
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+        try:
+            deadline = loop.time() + BATCH_WAIT
+            while len(batch) < BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            preds = model.predict(vectorizer.transform([m for m, _, _ in batch]))
+            for (_, key, fut), ml in zip(batch, preds):
+                CLASSIFY_CACHE[key] = ml
+                if not fut.done():
+                    fut.set_result(ml)
+            while len(CLASSIFY_CACHE) > CLASSIFY_CACHE_SIZE:
+                CLASSIFY_CACHE.popitem(last=False)
+        except Exception as e:
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
 
 # ================= LANGUAGE =================
 LANGUAGE_MAP = {
@@ -49,31 +116,58 @@ SAFE_TEXT = {
 }
 
 # ================= HELPERS =================
-def gemini_generate(prompt):
+def ojsonify(obj):
+    return app.response_class(
+        orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY),
+        mimetype="application/json"
+    )
+
+async def gemini_generate(prompt):
     if not gemini_allowed():
         return None
     try:
-        res = client.models.generate_content(
+        res = await client.aio.models.generate_content(
             model=GEMINI_MODEL,
             contents=prompt
         )
         return res.text.strip()
-    except:
+    except Exception:
         return None
 
 # ================= ENTROPY =================
+# count + sum in one JIT loop; numpy call overhead dominates on 4 KiB headers
+@njit(cache=True, fastmath=True)
+def _entropy_u8(a):
+    h = np.zeros(256, np.int64)
+    for i in range(a.size):
+        h[a[i]] += 1
+    n = a.size
+    e = 0.0
+    for c in h:
+        if c:
+            p = c / n
+            e -= p * np.log2(p)
+    return e
+
+_entropy_u8(np.zeros(1, np.uint8))
+
 def calculate_entropy(data: bytes) -> float:
     if not data:
         return 0
-    counts = Counter(data)
-    total = len(data)
-    return -sum((c/total) * math.log2(c/total) for c in counts.values())
+    return float(_entropy_u8(np.frombuffer(data, dtype=np.uint8)))
+
+# vault only looks at a fixed-size header
+VAULT_SAMPLE = 4096
 
 # ================= MALWARE =================
 SUSPICIOUS_EXT = {".exe",".dll",".js",".bat",".cmd",".ps1",".vbs",".jar"}
 SIGNATURES = [b"powershell -enc", b"cmd.exe /c", b"CreateRemoteThread", b"/bin/bash"]
+SCAN_CHUNK = 64 * 1024
+# carried between chunks so a signature split across a boundary still matches
+SIG_OVERLAP = max(len(s) for s in SIGNATURES) - 1
+SIG_RE = re.compile(b"|".join(re.escape(s) for s in SIGNATURES))
 
-def malware_scan(data: bytes, filename: str):
+def malware_scan(stream, filename: str):
     score, findings = 0, []
     ext = os.path.splitext(filename.lower())[1]
 
@@ -81,8 +175,17 @@ def malware_scan(data: bytes, filename: str):
         score += 30
         findings.append(f"Suspicious extension {ext}")
 
+    found, tail = set(), b""
+    while True:
+        buf = stream.read(SCAN_CHUNK)
+        if not buf:
+            break
+        window = tail + buf
+        found.update(SIG_RE.findall(window))
+        tail = window[-SIG_OVERLAP:]
+
     for sig in SIGNATURES:
-        if sig in data:
+        if sig in found:
             score += 40
             findings.append("Malicious signature detected")
 
@@ -90,92 +193,193 @@ def malware_scan(data: bytes, filename: str):
     return verdict, score, findings
 
 # ================= GEMINI EXPLANATIONS =================
-def explain(prompt, lang):
-    full_prompt = f"""
+def explain_prompt(prompt, lang):
+    return f"""
 Reply ONLY in {LANGUAGE_MAP.get(lang,"English")}.
 Max 2 lines.
 
 {prompt}
 """
-    return gemini_generate(full_prompt) or SAFE_TEXT.get(lang, SAFE_TEXT["en"])
+
+async def explain(prompt, lang):
+    return await gemini_generate(explain_prompt(prompt, lang)) or SAFE_TEXT.get(lang, SAFE_TEXT["en"])
+
+# file verdicts repeat a lot, so their explanations are reused per (key, language)
+EXPLAIN_CACHE = OrderedDict()
+EXPLAIN_CACHE_SIZE = 4096
+
+async def explain_cached(key, prompt, lang):
+    key = (*key, lang)
+    text = EXPLAIN_CACHE.get(key)
+    if text is not None:
+        EXPLAIN_CACHE.move_to_end(key)
+        return text
+
+    text = await gemini_generate(explain_prompt(prompt, lang))
+    if not text:
+        return SAFE_TEXT.get(lang, SAFE_TEXT["en"])
+
+    EXPLAIN_CACHE[key] = text
+    while len(EXPLAIN_CACHE) > EXPLAIN_CACHE_SIZE:
+        EXPLAIN_CACHE.popitem(last=False)
+    return text
+
+# explanations run in the background; verdict endpoints hand back a scan id
+# for display and an unguessable token that is the only key to the text.
+# They live in this process's memory, so the follow-up GET must reach the
+# same process: serve with a single Hypercorn worker (the event loop
+# handles concurrency), e.g. `hypercorn --workers 1 app:app`.
+EXPLANATIONS = OrderedDict()
+MAX_EXPLANATIONS = 1024
+SCAN_SEQ = itertools.count()
+PID = os.getpid()
+
+def new_scan_id(prefix):
+    return f"{prefix}-{PID:04X}{next(SCAN_SEQ):08X}"
+
+def schedule_explanation(prefix, coro):
+    scan_id = new_scan_id(prefix)
+    token = secrets.token_urlsafe(16)
+    EXPLANATIONS[token] = (scan_id, asyncio.create_task(coro))
+    while len(EXPLANATIONS) > MAX_EXPLANATIONS:
+        _, (_, task) = EXPLANATIONS.popitem(last=False)
+        task.cancel()
+    return scan_id, f"/explanation/{token}"
+
+# ================= LIFECYCLE =================
+@app.before_serving
+async def start_batch_classifier():
+    ensure_batch_classifier()
+
+@app.after_serving
+async def stop_batch_classifier():
+    if BATCH_TASK is not None:
+        BATCH_TASK.cancel()
 
 # ================= ROUTES =================
 @app.route("/")
-def home():
+async def home():
     return "✅ SurakshaAI backend running"
 
 # -------- PHISHING --------
 @app.route("/analyze", methods=["POST"])
-def analyze():
-    d = request.get_json()
+async def analyze():
+    d = await request.get_json()
+    if not isinstance(d, dict):
+        return ojsonify({"error": "Expected a JSON object body"}), 400
     msg = d.get("message","")
     lang = d.get("language","en")
 
-    X = vectorizer.transform([msg])
-    ml = model.predict(X)[0]
+    try:
+        ml = await classify(msg)
+    except asyncio.TimeoutError:
+        return ojsonify({"error": "Classifier timed out"}), 503
 
     verdict = "Dangerous" if ml=="Dangerous" else "Suspicious" if ml=="Suspicious" else "Safe"
     conf = 90 if verdict=="Dangerous" else 65 if verdict=="Suspicious" else 30
 
-    explanation = explain(
-        f"Message: {msg}\nVerdict: {verdict}\nConfidence: {conf}%",
-        lang
+    # short benign messages get the canned text instead of a Gemini call
+    if verdict == "Safe" and len(msg) < SHORT_MESSAGE:
+        return ojsonify({
+            "scan_id": new_scan_id("PHISH"),
+            "risk": verdict,
+            "confidence": conf,
+            "ai_explanation": SAFE_TEXT.get(lang, SAFE_TEXT["en"])
+        })
+
+    scan_id, explanation_url = schedule_explanation(
+        "PHISH",
+        explain(f"Message: {msg}\nVerdict: {verdict}\nConfidence: {conf}%", lang)
     )
 
-    return jsonify({
+    return ojsonify({
+        "scan_id": scan_id,
         "risk": verdict,
         "confidence": conf,
-        "ai_explanation": explanation
+        "explanation_url": explanation_url
     })
 
 # -------- VAULT --------
 @app.route("/vault-analyze", methods=["POST"])
-def vault():
-    file = request.files["file"]
-    lang = request.form.get("language","en")
+async def vault():
+    file = (await request.files)["file"]
+    lang = (await request.form).get("language","en")
 
-    data = file.read(4096)
+    data = file.read(VAULT_SAMPLE)
     entropy = round(calculate_entropy(data),2)
 
     verdict = "Malicious" if entropy > 7.5 else "Suspicious" if entropy > 6.8 else "Safe"
 
-    explanation = explain(
-        f"File: {file.filename}\nEntropy: {entropy}\nVerdict: {verdict}",
-        lang
+    # state the rule, not the value, so the cached text can't contradict the verdict
+    scan_id, explanation_url = schedule_explanation(
+        "VAULT",
+        explain_cached(
+            ("VAULT", verdict),
+            f"File entropy verdict: {verdict}\n"
+            "Rule: entropy above 7.5 is Malicious, above 6.8 is Suspicious, otherwise Safe",
+            lang
+        )
     )
 
-    return jsonify({
+    return ojsonify({
+        "scan_id": scan_id,
         "file_name": file.filename,
         "entropy": entropy,
         "verdict": verdict,
-        "gemini_explanation": explanation
+        "explanation_url": explanation_url
     })
 
 # -------- MALWARE --------
 @app.route("/malware-scan", methods=["POST"])
-def malware_scan_api():
-    file = request.files["file"]
-    lang = request.form.get("language","en")
-
-    data = file.read()
-    verdict, score, findings = malware_scan(data, file.filename)
-
-    explanation = explain(
-        f"File: {file.filename}\nVerdict: {verdict}\nFindings: {findings}",
-        lang
+async def malware_scan_api():
+    file = (await request.files)["file"]
+    lang = (await request.form).get("language","en")
+
+    verdict, score, findings = malware_scan(file.stream, file.filename)
+
+    scan_id, explanation_url = schedule_explanation(
+        "MAL",
+        explain_cached(
+            ("MAL", verdict, tuple(findings)),
+            f"Verdict: {verdict}\nFindings: {findings}",
+            lang
+        )
     )
 
-    return jsonify({
+    return ojsonify({
+        "scan_id": scan_id,
         "file_name": file.filename,
         "risk_score": min(score+10,100),
         "verdict": verdict,
-        "gemini_explanation": explanation,
+        "explanation_url": explanation_url,
         "malware_scan": {
             "score": score,
             "findings": findings
         }
     })
 
+# -------- EXPLANATION --------
+@app.route("/explanation/<token>")
+async def explanation(token):
+    entry = EXPLANATIONS.get(token)
+    if entry is None:
+        return ojsonify({"error": "Unknown explanation"}), 404
+    EXPLANATIONS.move_to_end(token)
+    scan_id, task = entry
+
+    try:
+        text = await asyncio.shield(task)
+    except asyncio.CancelledError:
+        if not task.cancelled():
+            raise
+        return ojsonify({"error": "Explanation expired"}), 410
+
+    return ojsonify({
+        "scan_id": scan_id,
+        "explanation": text
+    })
+
 # ================= RUN =================
+# production: hypercorn --workers 1 --bind 0.0.0.0:$PORT app:app
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
@@ -1,8 +1,9 @@
 import pandas as pd
 from sklearn.model_selection import train_test_split
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.naive_bayes import MultinomialNB
-import pickle
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.naive_bayes import ComplementNB
+import numpy as np
+import joblib
 
 # Load data
 data = pd.read_csv("train_data.csv")
@@ -13,19 +14,21 @@ y = data["label"]
 # Split (optional, we can train on all)
 X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
-# Convert text to numbers
-vectorizer = TfidfVectorizer()
-X_train_vec = vectorizer.fit_transform(X_train)
+# Convert text to numbers (stateless, must match the vectorizer in app.py)
+# 2^16 buckets make it unlikely that an unseen word lands on a trained one at predict time
+vectorizer = HashingVectorizer(n_features=1 << 16, alternate_sign=False, norm="l2")
+X_train_vec = vectorizer.transform(X_train)
 
 # Train model
-model = MultinomialNB()
+model = ComplementNB()
 model.fit(X_train_vec, y_train)
 
-# Save model and vectorizer
-with open("model.pkl", "wb") as f:
-    pickle.dump(model, f)
+# fp32 log-probs halve the bytes touched at predict time
+model.feature_log_prob_ = model.feature_log_prob_.astype(np.float32)
+# raw counts are only needed for partial_fit, not for predict
+del model.feature_count_, model.feature_all_
 
-with open("vectorizer.pkl", "wb") as f:
-    pickle.dump(vectorizer, f)
+# Save model (joblib so the app can memory-map the arrays)
+joblib.dump(model, "model.joblib")
 
 print("Model trained and saved!")
@@ -0,0 +1,11 @@
+// Fetches the Gemini explanation that a scan endpoint queued behind explanation_url.
+async function loadExplanation(url) {
+    try {
+        const res = await fetch(url, { cache: "no-store" });
+        if (!res.ok) throw new Error(res.status);
+        const data = await res.json();
+        return data.explanation || "Explanation unavailable";
+    } catch (e) {
+        return "Explanation unavailable";
+    }
+}